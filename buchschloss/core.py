@@ -271,8 +271,13 @@ class LibraryGroupAction(enum.Enum):
     NONE = 'none'
 
 
-def pbkdf(pw, salt, iterations=config.core.hash_iterations[0]):
-    """return pbkdf2_hmac('sha256', pw, salt, iterations)"""
+def pbkdf(pw, salt, iterations=None):
+    """return pbkdf2_hmac('sha256', pw, salt, iterations)
+
+    ``iterations`` defaults to the currently preferred number
+    """
+    if iterations is None:
+        iterations = config.core.hash_iterations[0]
     return pbkdf2_hmac('sha256', pw, salt, iterations)
 
 
@@ -430,6 +435,13 @@ def _update_library_group(lg_model: T.Type[models.Model],
     return errors
 
 
+_search_comparisons = {
+    **{op: getattr(operator, op) for op in ('eq', 'ne', 'gt', 'lt', 'ge', 'le')},
+    'in': operator.lshift,
+    'contains': lambda field, value: field.contains(value),
+}
+
+
 class ActionNamespace:
     """common stuff for the Book, Person, Member,
     Library, Group, Borrow and Script namespaces"""
@@ -509,9 +521,10 @@ class ActionNamespace:
             with <op> being a logical operation ("and" or "or") and <a>
             and <b> in that case being condition tuples
 
-            or a comparison operation ("contains", "eq", "ne", "gt", "ge", "lt" or "le")
-            in which case <a> is a (possibly dotted) string corresponding
+            or a comparison operation ("contains", "eq", "ne", "gt", "ge", "lt", "le"
+            or "in") in which case <a> is a (possibly dotted) string corresponding
             to the attribute name and <b> is the value to compare to.
+            For "in", <b> is a sequence of values, checked with SQL ``IN``.
 
             It (condition) may be empty, in which case it has no effect, i.e. is True
             when used with an 'and' and False when used with an 'or'.
@@ -525,7 +538,11 @@ class ActionNamespace:
         """
         check_level(login_context, cls.required_levels.search, cls.__name__ + '.search')
 
-        def follow_path(path, q):
+        pk = getattr(cls.model, cls.model.pk_name)
+
+        def follow_path(path):
+            """return the field at the end of ``path`` and a query
+            of primary keys joined up to it or None if no joins are needed"""
             def handle_many_to_many():
                 through = fv.through_model.alias()
                 cond_1 = (getattr(cur, cur.pk_name)
@@ -536,6 +553,7 @@ class ActionNamespace:
 
             *path, end = path.split('.')
             cur = mod = cls.model
+            q = cls.model.select(pk)
             for fn in path:
                 fv = getattr(mod, fn)
                 mod = fv.rel_model.alias()
@@ -549,9 +567,11 @@ class ActionNamespace:
                 cur = mod
             fv = getattr(mod, end)
             if isinstance(fv, peewee.ManyToManyField):
-                mod = fv.rel_model
+                mod = fv.rel_model.alias()
                 q = handle_many_to_many()
                 fv = getattr(mod, mod.pk_name)
+            elif not path:
+                q = None
             return fv, q
 
         def handle_condition(cond, q):
@@ -567,16 +587,17 @@ class ActionNamespace:
                     return getattr(operator, op + '_')(handle_condition(a, q),
                                                        handle_condition(b, q))
             else:
-                a, q = follow_path(a, q)
-                if op in ('eq', 'ne', 'gt', 'lt', 'ge', 'le'):
-                    return q.where(getattr(operator, op)(a, b))
-                elif op == 'in':
-                    return q.where(a << b)
-                elif op == 'contains':
-                    return q.where(a.contains(b))
+                try:
+                    comparison = _search_comparisons[op]
+                except KeyError:
+                    raise ValueError('`op` must be "and", "or", "eq", "ne", "gt", "lt", '
+                                     '"ge", "le", "in" or "contains"') from None
+                a, joined = follow_path(a)
+                if joined is None:
+                    return q.where(comparison(a, b))
                 else:
-                    raise ValueError('`op` must be "and", "or", "eq", "ne", "gt", "lt" '
-                                     '"ge", "le" or "contains"')
+                    # semi-join: a record matches once, however many related ones do
+                    return q.where(pk << joined.where(comparison(a, b)))
 
         query = cls.model.select_str_fields()
         result = handle_condition(condition, query)
@@ -1323,7 +1344,7 @@ class Script(ActionNamespace):
             LoginType.SCRIPT, script_lc_level, name=script.name, invoker=login_context)
         ui_callbacks = callbacks or cls.callbacks
         get_name_prefix = 'script-data::{}::'.format(script.name)
-        script_config = config.scripts.lua.get(script.name).mapping
+        script_config = config.scripts.lua.mapping.get(script.name, {})
         if ScriptPermissions.STORE in script.permissions:
             edit_func = partial(Script.edit, script.name, login_context=internal_priv_lc)
             add_storage = (
@@ -216,12 +216,20 @@ class LuaBS4Interface(LuaObject):
             with warnings.catch_warnings():
                 warnings.filterwarnings('ignore', 'No parser was')
                 self.tag = bs4.BeautifulSoup(markup, features=features)
-        self.text = self.tag.get_text()
-        self.attrs = lua.data_to_table(self.runtime, self.tag.attrs)
 
     def __str__(self):
         return str(self.tag)
 
+    @functools.cached_property
+    def text(self):
+        """the tag's text, only extracted when requested"""
+        return self.tag.get_text()
+
+    @functools.cached_property
+    def attrs(self):
+        """the tag's attributes as a Lua table"""
+        return lua.data_to_table(self.runtime, self.tag.attrs)
+
     def select(self, selector):
         """wrap bs4.Tag's .select"""
         return self.runtime.table(*map(
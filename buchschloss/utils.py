@@ -78,7 +78,21 @@ def get_name(internal: str):
         as namespace for the second (right).
     If a name isn't found, a warning is logged and the internal name returned,
         potentially modified
+
+    Results are cached until config.utils.names is replaced.
     """
+    names = config.utils.names
+    source = getattr(names, 'mapping', names)
+    if source is not get_name.source:
+        _lookup_name.cache_clear()
+        get_name.source = source
+    return _lookup_name(internal)
+get_name.source = None  # noqa
+
+
+@functools.lru_cache(maxsize=1024)
+def _lookup_name(internal: str):
+    """look up a name as described in get_name"""
     internal = internal.lower()
     if '__' in internal:
         r = []
@@ -187,9 +201,12 @@ def get_script_target(spec, *, ui_callbacks=None, login_context, propagate_bse=F
     return wrapped_target
 
 
-def get_runner():
-    """return a function that runs all startup tasks and schedules repeating tasks"""
-    scheduler = sched.scheduler(timefunc=time.time)
+def get_runner(timefunc=time.time):
+    """return a function that runs all startup tasks and schedules repeating tasks
+
+    ``timefunc`` supplies the current time as a timestamp
+    """
+    scheduler = sched.scheduler(timefunc=timefunc)
     for spec in config.scripts.startup:
         target = get_script_target(spec, login_context=core.internal_unpriv_lc)
         scheduler.enter(0, 0, target)
@@ -205,7 +222,7 @@ def get_runner():
         def target_wrapper(_f, _t=target, _id=script_id, _delay=delay):
             _t()
             last_invs = core.misc_data.last_script_invocations
-            last_invs[_id] = datetime.now()
+            last_invs[_id] = datetime.fromtimestamp(timefunc())
             core.misc_data.last_script_invocations = last_invs
             scheduler.enter(_delay, 0, functools.partial(_f, _f))
 
@@ -5,17 +5,34 @@ from buchschloss import config
 
 config.core.mapping['database name'] = ':memory:'
 config.core.log.mapping['file'] = ''
+# password tests check logic, not hash strength
+config.core.mapping['hash iterations'] = [1]
 
 from buchschloss import core, models  # noqa
 
 
-@pytest.fixture
-def db():
-    """bind the models to the test database"""
-    # since in-memory databases clear data when closing,
-    # we don't need an explicit drop_tables
-    models.db.create_tables(models.models)
-    models.Misc.create(pk='last_script_invocations', data={})
-    models.Misc.create(pk='latest_borrowers', data=[])
+@pytest.fixture(scope='session')
+def schema():
+    """create the tables and shared rows once and keep the in-memory database open"""
+    models.db.connect()
+    # test-only: nothing here needs to survive the session.
+    # :memory: databases already keep their journal in memory.
+    # These can't be changed inside a transaction, so set them before ``with``
+    models.db.pragma('synchronous', 'off')
+    models.db.pragma('temp_store', 'memory')
+    # the outer context keeps nested ``with models.db`` blocks from closing
+    # the connection, which would throw away the in-memory database
     with models.db:
+        models.db.create_tables(models.models)
+        models.Library.create(name='main')
+        models.Misc.create(pk='last_script_invocations', data={})
+        models.Misc.create(pk='latest_borrowers', data=[])
+        yield
+
+
+@pytest.fixture
+def db(schema):
+    """bind the models to the test database, rolling back changes afterwards"""
+    with models.db.atomic() as transaction:
         yield
+        transaction.rollback()
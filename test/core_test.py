@@ -1,44 +1,213 @@
 """Test core"""
 
 import datetime
-from functools import partial
+from functools import partial, lru_cache
 
 import pytest
 
 from buchschloss import config, core, models, utils
 
+_BOOK_DEFAULTS = dict(isbn=0, author='', title='', language='', publisher='',
+                      year=0, medium='', shelf='')
+_PERSON_DEFAULTS = dict(first_name='', last_name='', class_='', max_borrow=0)
+_LEVEL_CONTEXTS = [core.LoginContext(core.LoginType.INTERNAL, level)
+                   for level in range(config.MAX_LEVEL + 1)]
+_TODAY = datetime.date(2000, 1, 1)
+# view_str results for the records created in test_{book,person}_view_str.
+# __str__ and translated names are added in the tests
+_EXPECTED_BOOK_VIEW = {
+    'id': '1',
+    'isbn': '123',
+    'author': 'author',
+    'title': 'title',
+    'language': 'lang',
+    'publisher': 'publ',
+    'year': '456',
+    'medium': 'rare',
+    'series': '',
+    'series_number': '',
+    'concerned_people': '',
+    'genres': '',
+    'shelf': 'A5',
+    'library': 'lib0',
+    'groups': '',
+    'return_date': '-----',
+    'borrowed_by': '-----',
+    'borrowed_by_id': None,
+}
+_EXPECTED_PERSON_VIEW = {
+    'id': '123',
+    'first_name': 'first',
+    'last_name': 'last',
+    'class_': 'cls',
+    'max_borrow': '3',
+    'borrow_permission': str(utils.FormattedDate.fromdate(datetime.date(1956, 1, 31))),
+    'borrows': (),
+    'borrow_book_ids': [],
+    'libraries': '',
+}
+# actions checked by test_level_denied, keyed for required_level
+_LEVEL_CHECKED = {
+    'Person.new': core.Person.new,
+    'Person.edit': core.Person.edit,
+    'Person.view_str': core.Person.view_str,
+    'Person.view_repr': partial(core.Person.view_repr, 123),
+    'Person.search': partial(core.Person.search, ()),
+    'Book.new': core.Book.new,
+    'Book.edit': core.Book.edit,
+    'Library.new': core.Library.new,
+    'Library.edit': core.Library.edit,
+    'Group.new': core.Group.new,
+    'Group.edit': core.Group.edit,
+    'Group.activate': core.Group.activate,
+    'Member.new': core.Member.new,
+    'Member.edit': core.Member.edit,
+    'Borrow.edit': core.Borrow.edit,
+    'Script.new': core.Script.new,
+    'Script.edit': core.Script.edit,
+}
+
 
 def create_book(library='main', **options):
     """create a Book with falsey values. The Library can be specified"""
-    kwargs = dict(isbn=0, author='', title='', language='', publisher='',
-                  year=0, medium='', shelf='', library=library)
-    return models.Book.create(**{**kwargs, **options})
+    return models.Book.create(**{**_BOOK_DEFAULTS, 'library': library, **options})
 
 
 def create_person(id_, **options):
     """create a Person with falsey values"""
-    kwargs = dict(id=id_, first_name='', last_name='', class_='', max_borrow=0)
-    return models.Person.create(**{**kwargs, **options})
+    return models.Person.create(**{**_PERSON_DEFAULTS, 'id': id_, **options})
 
 
-def for_levels(func, perm_level, assert_func=lambda x: True):
-    """test for correct level testing"""
-    ctxt = core.internal_unpriv_lc
-    for level in range(perm_level):
-        ctxt.level = level
-        with pytest.raises(core.BuchSchlossBaseError):
-            func(login_context=ctxt)
-    ctxt.level = perm_level
+def create_books(n, library='main'):
+    """create ``n`` Books with falsey values in a single query"""
+    models.Book.insert_many([{**_BOOK_DEFAULTS, 'library': library}] * n).execute()
+
+
+def create_people(*ids):
+    """create People with falsey values and the given IDs in a single query"""
+    models.Person.insert_many([{**_PERSON_DEFAULTS, 'id': id_} for id_ in ids]).execute()
+
+
+@lru_cache(maxsize=None)
+def pbkdf_cached(pw, salt, iterations):
+    """memoized ``core.pbkdf`` for setting up Members"""
+    return core.pbkdf(pw, salt, iterations)
+
+
+def member_password(pw, salt=b''):
+    """return the hash ``core.login`` expects for a new Member"""
+    return pbkdf_cached(pw, salt, config.core.hash_iterations[0])
+
+
+def semisplit(text):
+    """split a ';'-separated view_str value into a sorted list"""
+    return sorted(text.split(';')) if text else []
+
+
+def book_values(field, *ids):
+    """return {<book ID>: <field value>} for the given Books in a single query"""
+    return dict(models.Book.select(models.Book.id, getattr(models.Book, field))
+                .where(models.Book.id << ids).tuples())
+
+
+def book_libraries(*ids):
+    """return {<book ID>: <library name>} for the given Books"""
+    return book_values('library', *ids)
+
+
+def book_groups(book_id):
+    """return the set of names of the Groups the given Book is in"""
+    through = models.Group.books.through_model
+    return {name for name, in through.select(through.group)
+            .where(through.book == book_id).tuples()}
+
+
+def person_libraries(person_id):
+    """return the set of names of the Libraries the given Person is in"""
+    through = models.Library.people.through_model
+    return {name for name, in through.select(through.library)
+            .where(through.person == person_id).tuples()}
+
+
+def assert_denied(func, level):
+    """assert ``func`` refuses a LoginContext with the given level"""
+    with pytest.raises(core.BuchSchlossPermError):
+        func(login_context=_LEVEL_CONTEXTS[level])
+
+
+def required_level(action):
+    """return the level configured for ``action`` ('<Namespace>.<function>')"""
+    namespace, func = action.split('.')
+    if func.startswith('view'):
+        func = 'view'
+    return getattr(getattr(config.core.required_levels, namespace), func)
+
+
+def at_level(func, action, assert_func=lambda x: True):
+    """test ``func`` succeeds at the level required for ``action``
+
+    Lower levels are covered by test_level_denied.
+    return a new LoginContext with that level for further use
+    """
+    ctxt = core.LoginContext(core.LoginType.INTERNAL, required_level(action))
     assert assert_func(func(login_context=ctxt))
     return ctxt
 
 
+def for_levels(func, action, assert_func=lambda x: True):
+    """test for correct level testing
+
+    return a new LoginContext with the level required for ``action`` for further use
+    """
+    for ctxt in _LEVEL_CONTEXTS[:required_level(action)]:
+        with pytest.raises(core.BuchSchlossBaseError):
+            func(login_context=ctxt)
+    return at_level(func, action, assert_func)
+
+
+@pytest.fixture
+def two_books(db):
+    """Books 1 and 2 with falsey values in 'main'"""
+    create_books(2)
+
+
+@pytest.fixture
+def two_groups(db):
+    """empty Groups 'group-1' and 'group-2'"""
+    models.Group.insert_many([{'name': 'group-1'}, {'name': 'group-2'}]).execute()
+
+
+class FrozenDate(datetime.date):
+    """a date class whose today() never changes"""
+    @classmethod
+    def today(cls):
+        return _TODAY
+
+
+@pytest.fixture
+def frozen_today(monkeypatch):
+    """make core use a fixed current date and return it"""
+    monkeypatch.setattr(core, 'date', FrozenDate)
+    return _TODAY
+
+
+class DummyRuntime:
+    """stand-in for a Lua runtime, the executed code provides ``func``"""
+    __slots__ = ('calls',)
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def execute(self, code):
+        return {'func': lambda: self.calls.append('func')}
+
+
 def test_auth_required(db):
     """test the @auth_required decorator"""
     models.Member.create(
-        name='name', salt=b'', level=0, password=core.pbkdf(b'Pa$$w0rd', b''))
+        name='name', salt=b'', level=0, password=member_password(b'Pa$$w0rd'))
     ctxt_member = core.LoginContext(core.LoginType.MEMBER, 0, name='name')
-    ctxt_internal = core.internal_unpriv_lc
+    ctxt_internal = core.LoginContext(core.LoginType.INTERNAL, 0)
 
     @core.auth_required
     def test(login_context):
@@ -62,22 +231,29 @@ def test_auth_required(db):
     assert test(login_context=ctxt_internal)
 
 
-def test_login_logout(db):
+def test_login_logout(db, monkeypatch):
     """test login and logout"""
     models.Member.create(name='name', level=0, salt=b'',
-                         password=core.pbkdf(b'Pa$$w0rd', b''))
+                         password=member_password(b'Pa$$w0rd'))
     with pytest.raises(core.BuchSchlossBaseError):
         core.login('name', 'wrong password')
     ctxt = core.login('name', 'Pa$$w0rd')
     assert ctxt.name == 'name'
     with pytest.raises(core.BuchSchlossBaseError):
         core.login('does not exist', '')
-    config.core.hash_iterations.insert(0, 1)
-    try:
-        core.login('name', 'Pa$$w0rd')
-        assert models.Member.get_by_id('name').password == core.pbkdf(b'Pa$$w0rd', b'')
-    finally:
-        config.core.hash_iterations.pop(0)
+    monkeypatch.setitem(config.core.mapping, 'hash iterations', [2, 1])
+    core.login('name', 'Pa$$w0rd')
+    assert models.Member.get_by_id('name').password == core.pbkdf(b'Pa$$w0rd', b'', 2)
+
+
+@pytest.mark.parametrize('func, level', [
+    pytest.param(func, level, id='{}-{}'.format(name, level))
+    for name, func in _LEVEL_CHECKED.items()
+    for level in range(required_level(name))
+])
+def test_level_denied(func, level):
+    """test actions are refused below their required level"""
+    assert_denied(func, level)
 
 
 def test_misc_data(db):
@@ -126,16 +302,19 @@ def test_data_ns():
     assert {data: 'xyz'}[1] == 'xyz' == {1: 'xyz'}[data]
 
 
-def test_person_new(db):
+def test_person_new(db, frozen_today):
     """test Person.new"""
-    ctxt = for_levels(
+    # 'main' is deleted so People 123-125 are created without it.
+    # Person.new still writes the link, so check membership through the join
+    models.Library.delete_by_id('main')
+    ctxt = at_level(
         partial(
             core.Person.new,
             id_=123,
             first_name='first',
             last_name='last',
             class_='cls'),
-        3)
+        'Person.new')
     person_new = partial(core.Person.new, login_context=ctxt)
     p = models.Person.get_by_id(123)
     assert p.id == 123
@@ -155,24 +334,24 @@ def test_person_new(db):
     p = models.Person.get_by_id(124)
     assert p.id == 124
     assert p.max_borrow == 5
-    assert p.borrow_permission == datetime.date.today() + datetime.timedelta(weeks=52)
+    assert p.borrow_permission == frozen_today + datetime.timedelta(weeks=52)
     person_new(id_=125, first_name='first', last_name='last', class_='cls',
                borrow_permission=datetime.date(1956, 1, 31))
     p = models.Person.get_by_id(125)
     assert p.id == 125
     assert p.borrow_permission == datetime.date(1956, 1, 31)
-    models.Library.create(name='main')
+    main = models.Library.create(name='main')
     person_new(id_=126, first_name='first', last_name='last', class_='cls')
     p = models.Person.get_by_id(126)
     assert p.id == 126
-    assert list(p.libraries) == [models.Library.get_by_id('main')]
+    assert list(p.libraries) == [main]
 
 
-def test_person_edit(db):
+def test_person_edit(db, frozen_today):
     """test Person.edit"""
     models.Person.create(id=123, first_name='first', last_name='last', class_='cls',
                          max_borrow=3, borrow_permission=datetime.date(1956, 1, 31))
-    ctxt = for_levels(partial(core.Person.edit, 123), 3)
+    ctxt = at_level(partial(core.Person.edit, 123), 'Person.edit')
     person_edit = partial(core.Person.edit, login_context=ctxt)
     person_edit(123, first_name='other_value')
     assert models.Person.get_by_id(123).first_name == 'other_value'
@@ -182,13 +361,12 @@ def test_person_edit(db):
     assert p.borrow_permission is None
     person_edit(123, pay=True)
     assert (models.Person.get_by_id(123).borrow_permission
-            == datetime.date.today() + datetime.timedelta(weeks=52))
+            == frozen_today + datetime.timedelta(weeks=52))
     models.Library.create(name='lib_1')
     models.Library.create(name='lib_2')
     e = person_edit(123, libraries=('lib_1', 'lib_does_not_exist'))
     assert e
-    assert (list(models.Person.get_by_id(123).libraries)
-            == [models.Library.get_by_id('lib_1')])
+    assert person_libraries(123) == {'lib_1'}
     with pytest.raises(core.BuchSchlossBaseError):
         person_edit(124)
     with pytest.raises(TypeError):
@@ -201,23 +379,12 @@ def test_person_view_str(db):
     """test Person.view_str"""
     p = models.Person.create(id=123, first_name='first', last_name='last', class_='cls',
                              max_borrow=3, borrow_permission=datetime.date(1956, 1, 31))
-    ctxt = for_levels(partial(core.Person.view_str, 123), 1)
+    ctxt = at_level(partial(core.Person.view_str, 123), 'Person.view_str')
     person_view = partial(core.Person.view_str, login_context=ctxt)
     with pytest.raises(core.BuchSchlossBaseError):
         person_view(12345)
-    assert person_view(123) == {
-        'id': '123',
-        'first_name': 'first',
-        'last_name': 'last',
-        'class_': 'cls',
-        'max_borrow': '3',
-        'borrow_permission': str(utils.FormattedDate.fromdate(datetime.date(1956, 1, 31))),
-        'borrows': (),
-        'borrow_book_ids': [],
-        'libraries': '',
-        '__str__': str(models.Person.get_by_id(123)),
-    }
-    p.libraries.add(models.Library.create(name='main'))
+    assert person_view(123) == {**_EXPECTED_PERSON_VIEW, '__str__': str(p)}
+    p.libraries.add('main')
     assert person_view(123)['libraries'] == 'main'
     create_book()
     models.Borrow.create(person=123, book=1, return_date=datetime.date(1956, 1, 31))
@@ -226,7 +393,7 @@ def test_person_view_str(db):
     assert info['borrow_book_ids'] == [1]
     p.libraries.add(models.Library.create(name='testlib'))
     info = person_view(123)
-    assert info['libraries'] in ('main;testlib', 'testlib;main')
+    assert semisplit(info['libraries']) == ['main', 'testlib']
     create_book()
     models.Borrow.create(person=123, book=2, return_date=datetime.date(1956, 1, 31))
     info = person_view(123)
@@ -243,7 +410,7 @@ def test_person_view_str(db):
 def test_person_view_repr(db):
     """test Person.view_repr"""
     p = create_person(123)
-    ctxt = for_levels(partial(core.Person.view_repr, 123), 1, lambda r: r == str(p))
+    ctxt = at_level(partial(core.Person.view_repr, 123), 'Person.view_repr', lambda r: r == str(p))
     person_view = partial(core.Person.view_repr, login_context=ctxt)
     with pytest.raises(core.BuchSchlossBaseError):
         person_view(124)
@@ -251,12 +418,11 @@ def test_person_view_repr(db):
 
 def test_book_new(db):
     """test Book.new"""
-    models.Library.create(name='main')
-    ctxt = for_levels(partial(
+    ctxt = at_level(partial(
         core.Book.new,
         isbn=123, year=456, author='author', title='title', language='lang',
         publisher='publisher', medium='medium', shelf='A1'),
-        2,
+        'Book.new',
         lambda r: r == 1
     )
     book_new = partial(core.Book.new, login_context=ctxt)
@@ -270,7 +436,7 @@ def test_book_new(db):
     assert b.medium == 'medium'
     assert b.shelf == 'A1'
     assert b.library.name == 'main'
-    assert tuple(b.groups) == ()
+    assert not book_groups(b.id)
     with pytest.raises(core.BuchSchlossBaseError):
         book_new(isbn=123, year=456, author='author', title='title', language='lang',
                  publisher='publisher', medium='medium', shelf='A1',
@@ -280,54 +446,47 @@ def test_book_new(db):
                     publisher='publisher', medium='medium', shelf='A1',
                     library='other_lib')
     assert b_id == 2
-    assert models.Book.get_by_id(b_id).library.name == 'other_lib'
+    assert book_libraries(b_id) == {b_id: 'other_lib'}
     b_id = book_new(isbn=123, year=456, author='author', title='title', language='lang',
                     publisher='publisher', medium='medium', shelf='A1',
                     groups=['grp0'])
     assert b_id == 3
-    assert list(models.Book.get_by_id(b_id).groups) == [models.Group.get_by_id('grp0')]
+    assert book_groups(b_id) == {'grp0'}
     b_id = book_new(isbn=123, year=456, author='author', title='title', language='lang',
                     publisher='publisher', medium='medium', shelf='A1',
                     groups=['grp0', 'grp1'])
     assert b_id == 4
-    assert set(models.Book.get_by_id(b_id).groups) == {
-        models.Group.get_by_id('grp0'), models.Group.get_by_id('grp1')}
+    assert book_groups(b_id) == {'grp0', 'grp1'}
+    # missing Groups are created, not only linked by name
+    assert models.Group.select().where(models.Group.name << ['grp0', 'grp1']).count() == 2
 
 
-def test_book_edit(db):
+def test_book_edit(db, two_books, two_groups):
     """test Book.edit"""
-    models.Library.create(name='main')
-    models.Group.create(name='group-1')
-    models.Group.create(name='group-2')
-    create_book()
-    create_book()
-    ctxt = for_levels(partial(core.Book.edit, 1, isbn=1), 2, lambda r: not r)
+    ctxt = at_level(partial(core.Book.edit, 1, isbn=1), 'Book.edit', lambda r: not r)
     book_edit = partial(core.Book.edit, login_context=ctxt)
-    assert models.Book.get_by_id(1).isbn == 1
-    assert models.Book.get_by_id(2).isbn == 0
+    assert book_values('isbn', 1, 2) == {1: 1, 2: 0}
     assert not book_edit(1, author='author', shelf='shl')
-    assert models.Book.get_by_id(1).author == 'author'
-    assert models.Book.get_by_id(1).shelf == 'shl'
-    assert models.Book.get_by_id(2).author == ''
-    assert models.Book.get_by_id(2).shelf == ''
+    assert book_values('author', 1, 2) == {1: 'author', 2: ''}
+    assert book_values('shelf', 1, 2) == {1: 'shl', 2: ''}
     models.Library.create(name='lib')
     assert not book_edit(1, library='lib')
-    assert models.Book.get_by_id(1).library.name == 'lib'
-    assert models.Book.get_by_id(2).library.name == 'main'
+    assert book_libraries(1, 2) == {1: 'lib', 2: 'main'}
     with pytest.raises(core.BuchSchlossBaseError):
         book_edit(1, library='does_not_exist')
     assert not book_edit(1, groups=['group-1'])
-    assert set(g.name for g in models.Book.get_by_id(1).groups) == {'group-1'}
+    assert book_groups(1) == {'group-1'}
     e = book_edit(1, groups=('group-2', 'does not exist'))
     assert e == {utils.get_name('error::no_Group_with_id_{}').format('does not exist')}
-    assert set(g.name for g in models.Book.get_by_id(1).groups) == {'group-2'}
+    assert book_groups(1) == {'group-2'}
     assert models.Book.get_by_id(1).library.name == 'lib'
-    assert not book_edit(1, medium='med')
-    assert not book_edit(1, year=123)
-    assert models.Book.get_by_id(1).medium == 'med'
-    assert models.Book.get_by_id(1).year == 123
-    assert models.Book.get_by_id(2).medium == ''
-    assert models.Book.get_by_id(2).year == 0
+
+
+@pytest.mark.parametrize('field,value', [('medium', 'med'), ('year', 123)])
+def test_book_edit_field(db, two_books, field, value):
+    """test Book.edit on single fields"""
+    assert not core.Book.edit(1, login_context=core.internal_priv_lc, **{field: value})
+    assert book_values(field, 1, 2) == {1: value, 2: _BOOK_DEFAULTS[field]}
 
 
 def test_book_view_str(db):
@@ -342,34 +501,17 @@ def test_book_view_str(db):
     book_view = partial(core.Book.view_str,
                         login_context=core.internal_unpriv_lc)
     assert book_view(1) == {
-        'id': '1',
-        'isbn': '123',
-        'author': 'author',
-        'title': 'title',
-        'language': 'lang',
-        'publisher': 'publ',
-        'year': '456',
-        'medium': 'rare',
-        'series': '',
-        'series_number': '',
-        'concerned_people': '',
-        'genres': '',
-        'shelf': 'A5',
-        'library': 'lib0',
-        'groups': '',
+        **_EXPECTED_BOOK_VIEW,
         'status': utils.get_name('Book::available'),
-        'return_date': '-----',
-        'borrowed_by': '-----',
-        'borrowed_by_id': None,
         '__str__': str(b),
     }
-    b.library = models.Library.get_by_id('lib1')
+    b.library = 'lib1'
     b.save()
     assert book_view(1)['library'] == 'lib1'
     b.groups.add('grp0')
     assert book_view(1)['groups'] == 'grp0'
     b.groups.add('grp1')
-    assert book_view(1)['groups'] in ('grp0;grp1', 'grp1;grp0')
+    assert semisplit(book_view(1)['groups']) == ['grp0', 'grp1']
     models.Person.create(id=123, first_name='first', last_name='last',
                          class_='cls', max_borrow=3)
     borrow = models.Borrow.create(book=1, person=123, return_date=datetime.date(1956, 1, 31))
@@ -386,56 +528,43 @@ def test_book_view_str(db):
     assert book_view(1)['status'] == utils.get_name('Book::inactive')
 
 
-def test_library_new(db):
+def test_library_new(db, two_books):
     """test Library.new"""
-    models.Library.create(name='main')
-    create_book()
-    create_book()
-    models.Person.create(id=123, first_name='', last_name='', class_='', max_borrow=0)
-    models.Person.create(id=456, first_name='', last_name='', class_='', max_borrow=0)
-    ctxt = for_levels(partial(core.Library.new, 'testlib'), 3)
+    create_people(123, 456)
+    ctxt = at_level(partial(core.Library.new, 'testlib'), 'Library.new')
     library_new = partial(core.Library.new, login_context=ctxt)
     assert models.Library.get_or_none(name='testlib')
     with pytest.raises(core.BuchSchlossBaseError):
         library_new('testlib')
     assert models.Library.get_by_id('testlib').pay_required
     library_new('test-1', books=[1], people=[123])
-    assert models.Book.get_by_id(1).library.name == 'test-1'
-    assert (tuple(models.Person.get_by_id(123).libraries)
-            == (models.Library.get_by_id('test-1'),))
+    assert book_libraries(1) == {1: 'test-1'}
+    assert person_libraries(123) == {'test-1'}
     library_new('test-2', books=(1, 2), people=[123, 456])
-    assert models.Book.get_by_id(1).library.name == 'test-2'
-    assert models.Book.get_by_id(1).library.name == 'test-2'
-    assert (set(models.Person.get_by_id(123).libraries)
-            == {models.Library.get_by_id('test-1'), models.Library.get_by_id('test-2')})
-    assert (tuple(models.Person.get_by_id(456).libraries)
-            == (models.Library.get_by_id('test-2'),))
+    assert book_libraries(1, 2) == {1: 'test-2', 2: 'test-2'}
+    assert person_libraries(123) == {'test-1', 'test-2'}
+    assert person_libraries(456) == {'test-2'}
 
 
 def test_library_edit(db):
     """test Library.edit"""
-    models.Library.create(name='main')
-    models.Library.create(name='testlib')
-    models.Library.create(name='test-2')
-    create_book()
-    create_book()
-    create_book()
+    models.Library.insert_many([{'name': 'testlib'}, {'name': 'test-2'}]).execute()
+    create_books(3)
     create_book('test-2')
-    create_person(123)
-    create_person(124)
-    ctxt = for_levels(partial(core.Library.edit, core.LibraryGroupAction.NONE, 'testlib'), 3)
+    create_people(123, 124)
+    ctxt = at_level(partial(core.Library.edit, core.LibraryGroupAction.NONE, 'testlib'),
+                    'Library.edit')
     library_edit = partial(core.Library.edit, login_context=ctxt)
     with pytest.raises(core.BuchSchlossBaseError):
         library_edit(core.LibraryGroupAction.NONE, 'does not exist')
     library_edit(core.LibraryGroupAction.ADD, 'testlib', books=[1])
-    assert models.Book.get_by_id(1).library.name == 'testlib'
+    assert book_libraries(1) == {1: 'testlib'}
     library_edit(core.LibraryGroupAction.ADD, 'testlib', books=[2, 3], people=[123])
-    assert all(models.Book.get_by_id(n).library.name == 'testlib' for n in range(1, 4))
+    assert book_libraries(1, 2, 3) == dict.fromkeys(range(1, 4), 'testlib')
     assert [p.id for p in models.Library.get_by_id('testlib').people] == [123]
     library_edit(core.LibraryGroupAction.REMOVE, 'testlib', books=[3, 4], people=[123])
-    assert models.Book.get_by_id(4).library.name == 'test-2'
-    assert models.Book.get_by_id(3).library.name == 'main'
-    assert not models.Person.get_by_id(123).libraries
+    assert book_libraries(3, 4) == {3: 'main', 4: 'test-2'}
+    assert not person_libraries(123)
     library_edit(core.LibraryGroupAction.DELETE, 'testlib')
     assert not models.Library.get_by_id('testlib').people
     assert not models.Library.get_by_id('testlib').books
@@ -447,14 +576,10 @@ def test_library_edit(db):
     assert not models.Library.get_by_id('testlib').pay_required
 
 
-def test_library_view_str(db):
+def test_library_view_str(db, two_books):
     """test Library.view_str"""
-    models.Library.create(name='main')
     lib = models.Library.create(name='lib')
-    b_1 = create_book()
-    b_2 = create_book()
-    p_1 = create_person(123)
-    p_2 = create_person(124)
+    create_people(123, 124)
     library_view = partial(core.Library.view_str,
                            login_context=core.internal_unpriv_lc)
     with pytest.raises(core.BuchSchlossBaseError):
@@ -465,124 +590,104 @@ def test_library_view_str(db):
         'people': '',
         'books': '',
     }
-    lib.people.add(p_1)
+    lib.people.add(123)
     assert library_view('lib')['people'] == '123'
-    lib.people.add(p_2)
-    assert set(library_view('lib')['people'].split(';')) == {'123', '124'}
-    b_1.library = lib
-    b_1.save()
+    lib.people.add(124)
+    assert semisplit(library_view('lib')['people']) == ['123', '124']
+    models.Book.update(library=lib).where(models.Book.id == 1).execute()
     assert library_view('lib')['books'] == '1'
-    b_2.library = lib
-    b_2.save()
-    assert set(library_view('lib')['books'].split(';')) == {'1', '2'}
+    models.Book.update(library=lib).where(models.Book.id == 2).execute()
+    assert semisplit(library_view('lib')['books']) == ['1', '2']
 
 
-def test_group_new(db):
+def test_group_new(db, two_books):
     """test Group.new"""
-    models.Library.create(name='main')
-    create_book()
-    create_book()
-    ctxt = for_levels(partial(core.Group.new, 'test-grp'), 3)
+    ctxt = at_level(partial(core.Group.new, 'test-grp'), 'Group.new')
     group_new = partial(core.Group.new, login_context=ctxt)
     assert not models.Group.get_by_id('test-grp').books
     with pytest.raises(core.BuchSchlossBaseError):
         group_new('test-grp')
     group_new('test-2', [1, 2])
-    assert list(g.name for g in models.Book.get_by_id(1).groups) == ['test-2']
-    assert list(g.name for g in models.Book.get_by_id(2).groups) == ['test-2']
+    assert book_groups(1) == {'test-2'}
+    assert book_groups(2) == {'test-2'}
     group_new('test-3', [2])
-    assert list(g.name for g in models.Book.get_by_id(1).groups) == ['test-2']
-    assert set(g.name for g in models.Book.get_by_id(2).groups) == {'test-2', 'test-3'}
+    assert book_groups(1) == {'test-2'}
+    assert book_groups(2) == {'test-2', 'test-3'}
     group_new('test-4', [12345])
 
 
-def test_group_edit(db):
+def test_group_edit(db, two_books, two_groups):
     """test Group.edit"""
-    models.Library.create(name='main')
-    models.Group.create(name='group-1')
-    models.Group.create(name='group-2')
-    create_book()
-    create_book()
-    ctxt = for_levels(partial(core.Group.edit, core.LibraryGroupAction.NONE, 'group-1', ()), 3)
+    ctxt = at_level(partial(core.Group.edit, core.LibraryGroupAction.NONE, 'group-1', ()),
+                    'Group.edit')
     group_edit = partial(core.Group.edit, login_context=ctxt)
     with pytest.raises(core.BuchSchlossBaseError):
         group_edit(core.LibraryGroupAction.NONE, 'does not exist', ())
     group_edit(core.LibraryGroupAction.ADD, 'group-1', [1])
-    assert set(g.name for g in models.Book.get_by_id(1).groups) == {'group-1'}
-    assert not models.Book.get_by_id(2).groups
-    assert 'group-2' not in models.Book.get_by_id(1).groups + models.Book.get_by_id(2).groups
+    assert book_groups(1) == {'group-1'}
+    assert not book_groups(2)
+    assert 'group-2' not in book_groups(1) | book_groups(2)
     group_edit(core.LibraryGroupAction.REMOVE, 'group-1', iter([1, 2, 3]))
     group_edit(core.LibraryGroupAction.ADD, 'group-1', [2])
-    assert not models.Book.get_by_id(1).groups
-    assert set(g.name for g in models.Book.get_by_id(2).groups) == {'group-1'}
-    assert 'group-2' not in models.Book.get_by_id(1).groups + models.Book.get_by_id(2).groups
+    assert not book_groups(1)
+    assert book_groups(2) == {'group-1'}
+    assert 'group-2' not in book_groups(1) | book_groups(2)
     group_edit(core.LibraryGroupAction.DELETE, 'group-1', ())
-    assert not models.Book.get_by_id(1).groups
-    assert not models.Book.get_by_id(2).groups
-    assert set() == {'group-1', 'group-2'} & set(models.Book.get_by_id(1).groups
-                                                 + models.Book.get_by_id(2).groups)
+    assert not book_groups(1)
+    assert not book_groups(2)
+    assert not {'group-1', 'group-2'} & (book_groups(1) | book_groups(2))
 
 
-def test_group_activate(db):
+def test_group_activate(db, two_groups):
     """test Group.activate"""
-    models.Library.create(name='main')
     models.Library.create(name='lib-1')
     models.Library.create(name='lib-2')
-    models.Group.create(name='group-1')
-    models.Group.create(name='group-2')
-    books = [create_book(),
-             create_book(),
-             create_book(),
-             ]
-    ctxt = for_levels(partial(core.Group.activate, 'group-1'), 3, lambda r: not r)
+    create_books(3)
+    books = list(models.Book.select().order_by(models.Book.id))
+    ctxt = at_level(partial(core.Group.activate, 'group-1'), 'Group.activate', lambda r: not r)
     group_activate = partial(core.Group.activate, login_context=ctxt)
     with pytest.raises(core.BuchSchlossBaseError):
         group_activate('does not exist')
     books[0].groups.add('group-1')
     books[1].groups.add('group-2')
     assert not group_activate('group-1', dest='lib-1')
-    assert models.Book.get_by_id(1).library.name == 'lib-1'
-    assert models.Book.get_by_id(2).library.name == 'main'
-    b = models.Book.get_by_id(3)
+    assert book_libraries(1, 2) == {1: 'lib-1', 2: 'main'}
+    b = books[2]
     assert b.library.name == 'main'
     b.groups.add('group-1')
-    b.library = models.Library.get_by_id('lib-2')
+    b.library = 'lib-2'
     b.save()
     assert not group_activate('group-1', ['lib-1'])
-    assert models.Book.get_by_id(1).library.name == 'main'
-    assert models.Book.get_by_id(3).library.name == 'lib-2'
+    assert book_libraries(1, 3) == {1: 'main', 3: 'lib-2'}
     with pytest.raises(core.BuchSchlossBaseError):
         group_activate('group-1', ['does not exist', 'lib-2'])
     with pytest.raises(core.BuchSchlossBaseError):
         group_activate('group-1', ['lib-1'], 'does not exist')
 
 
-def test_group_view_str(db):
+def test_group_view_str(db, two_books):
     """test Group.view_str"""
-    models.Library.create(name='main')
-    models.Group.create(name='group-1')
-    create_book()
-    create_book()
+    group = models.Group.create(name='group-1')
     group_view = partial(core.Group.view_str,
                          login_context=core.internal_unpriv_lc)
     assert group_view('group-1') == {
-        '__str__': str(models.Group.get_by_id('group-1')),
+        '__str__': str(group),
         'name': 'group-1',
         'books': ''
     }
     with pytest.raises(core.BuchSchlossBaseError):
         group_view('does not exist')
-    models.Group.get_by_id('group-1').books = [1]
+    group.books = [1]
     assert group_view('group-1')['books'] == '1'
-    models.Group.get_by_id('group-1').books.add(2)
-    assert group_view('group-1')['books'] in ('1;2', '2;1')
-    models.Group.get_by_id('group-1').books.remove(1)
+    group.books.add(2)
+    assert semisplit(group_view('group-1')['books']) == ['1', '2']
+    group.books.remove(1)
     assert group_view('group-1')['books'] == '2'
 
 
 def test_member_new(db):
     """test member.new"""
-    ctxt = for_levels(partial(core.Member.new, 'name', 'Pa$$w0rd', 3), 4)
+    ctxt = at_level(partial(core.Member.new, 'name', 'Pa$$w0rd', 3), 'Member.new')
     member_new = partial(core.Member.new, login_context=ctxt)
     m = models.Member.get_by_id('name')
     assert m.level == 3
@@ -594,7 +699,7 @@ def test_member_new(db):
 def test_member_edit(db):
     """test Member.edit"""
     models.Member.create(name='name', level=0, salt=b'', password=b'')
-    ctxt = for_levels(partial(core.Member.edit, 'name', level=4), 4)
+    ctxt = at_level(partial(core.Member.edit, 'name', level=4), 'Member.edit')
     member_edit = partial(core.Member.edit, login_context=ctxt)
     assert models.Member.get_by_id('name').level == 4
     for kw in ({'name': 'new'}, {'salt': b''}, {'password': b''}):
@@ -606,9 +711,10 @@ def test_member_edit(db):
 
 def test_member_change_password(db):
     """test Member.change_password"""
-    models.Member.create(name='name', level=0, salt=b'', password=core.pbkdf(b'', b''))
-    models.Member.create(name='other', level=0, salt=b'', password=core.pbkdf(b'', b''))
-    for_levels(partial(core.Member.change_password, 'name', 'new'), 4)
+    models.Member.create(name='name', level=0, salt=b'', password=member_password(b''))
+    models.Member.create(name='other', level=0, salt=b'', password=member_password(b''))
+    for_levels(partial(core.Member.change_password, 'name', 'new'),
+               'Member.change_password')
     assert core.authenticate(models.Member.get_by_id('name'), 'new')
     ctxt_editee = core.LoginContext(core.LoginType.MEMBER, 0, name='name')
     ctxt_other = core.LoginContext(core.LoginType.MEMBER, 0, name='other')
@@ -630,39 +736,30 @@ def test_member_view_str(db):
     }
 
 
-def test_borrow_new(db):
+def test_borrow_new(db, frozen_today):
     """test Borrow.new"""
     def restitute(borrow_id):
-        b = models.Borrow.get_by_id(borrow_id)
-        b.is_back = True
-        b.save()
+        models.Borrow.update(is_back=True).where(models.Borrow.id == borrow_id).execute()
 
-    models.Library.create(name='main')
     test_lib = models.Library.create(name='test-lib')
     models.Library.create(name='no-pay', pay_required=False)
-    create_book()
-    create_book()
+    create_books(2)
     create_book('test-lib')
     create_book('no-pay')
     p = create_person(123, max_borrow=1,
-                      borrow_permission=(datetime.date.today()
+                      borrow_permission=(frozen_today
                                          + datetime.timedelta(days=1)),
                       libraries=['main', 'no-pay'])
-    ctxt = core.internal_unpriv_lc
+    ctxt = core.LoginContext(core.LoginType.INTERNAL, 4)
     borrow_new = partial(core.Borrow.new, login_context=ctxt)
-    # follows config settings
-    for i in range(5):
-        ctxt.level = i
-        with pytest.raises(core.BuchSchlossBaseError):
-            borrow_new(1, 123, config.core.borrow_time_limit[i] + 1)
-    weeks = config.core.borrow_time_limit[i]
+    weeks = config.core.borrow_time_limit[4]
     borrow_new(1, 123, weeks)
     # correct data
     assert len(models.Borrow.select()) == 1
     b = models.Borrow.get_by_id(1)
     assert b.person.id == 123
     assert b.book.id == 1
-    assert b.return_date == datetime.date.today() + datetime.timedelta(weeks=weeks)
+    assert b.return_date == frozen_today + datetime.timedelta(weeks=weeks)
     # respects Person.max_borrow
     with pytest.raises(core.BuchSchlossBaseError):
         borrow_new(2, 123, weeks)
@@ -674,7 +771,7 @@ def test_borrow_new(db):
     borrow_new(3, 123, weeks)
     restitute(2)
     # respects pay_required and accepts keyword arguments
-    p.borrow_permission = datetime.date.today() - datetime.timedelta(days=1)
+    p.borrow_permission = frozen_today - datetime.timedelta(days=1)
     p.save()
     with pytest.raises(core.BuchSchlossBaseError):
         borrow_new(person=123, book=2, weeks=weeks)
@@ -687,14 +784,25 @@ def test_borrow_new(db):
     borrow_new(2, 123, weeks, override=True)
 
 
-def test_borrow_edit(db):
+@pytest.mark.parametrize('level', range(5))
+def test_borrow_new_time_limit(db, frozen_today, level):
+    """test Borrow.new follows the configured time limits"""
+    create_book()
+    create_person(123, max_borrow=1, libraries=['main'],
+                  borrow_permission=frozen_today + datetime.timedelta(days=1))
+    with pytest.raises(core.BuchSchlossBaseError):
+        core.Borrow.new(1, 123, config.core.borrow_time_limit[level] + 1,
+                        login_context=_LEVEL_CONTEXTS[level])
+    assert not models.Borrow.select().exists()
+
+
+def test_borrow_edit(db, frozen_today):
     """test Borrow.edit"""
-    today = datetime.date.today()
-    models.Library.create(name='main')
+    today = frozen_today
     create_person(123)
     create_book()
     models.Borrow.create(person=123, book=1, return_date=today)
-    ctxt = for_levels(partial(core.Borrow.edit, 1, weeks=1), 1)
+    ctxt = at_level(partial(core.Borrow.edit, 1, weeks=1), 'Borrow.edit')
     assert (models.Borrow.get_by_id(1).return_date - today).days == 7
     with pytest.raises(TypeError):
         core.Borrow.edit(1, return_date=today, weeks=1, login_context=ctxt)
@@ -705,11 +813,10 @@ def test_borrow_edit(db):
 
 def test_search(db):
     """test searches"""
-    models.Library.create(name='main')
     book_1 = core.DataNamespace(core.Book, create_book(author='author name'), None)
     book_2 = core.DataNamespace(core.Book, create_book(author='author 2', year=2000), None)
     person = core.DataNamespace(core.Person, create_person(123, class_='cls', libraries=['main']), None)
-    ctxt_person = for_levels(partial(core.Person.search, ()), 1)
+    ctxt_person = at_level(partial(core.Person.search, ()), 'Person.search')
     person_search = partial(core.Person.search, login_context=ctxt_person)
     book_search = partial(core.Book.search, login_context=core.internal_unpriv_lc)
     assert tuple(book_search(('author', 'eq', 'author name'))) == (book_1,)
@@ -734,15 +841,32 @@ def test_search(db):
     assert tuple(book_search(('author', 'in', ('neither', 'matches')))) == ()
 
 
+def test_search_distinct(db):
+    """test searches across to-many relations don't repeat results"""
+    book = core.DataNamespace(core.Book, create_book(), None)
+    create_person(123, class_='cls', libraries=['main'])
+    create_person(124, class_='cls', libraries=['main'])
+    book_search = partial(core.Book.search, login_context=core.internal_priv_lc)
+    assert tuple(book_search(('library.people.class_', 'eq', 'cls'))) == (book,)
+    assert tuple(book_search(('library.people.libraries', 'eq', 'main'))) == (book,)
+    # paths leading back to the searched model match the related records
+    person_search = partial(core.Person.search, login_context=core.internal_priv_lc)
+    assert {p.id for p in person_search(('libraries.people', 'eq', 123))} == {123, 124}
+    group = models.Group.create(name='grp')
+    for b in (models.Book.get_by_id(book.id), create_book()):
+        b.groups.add(group)
+    assert {b.id for b in book_search(('groups.books', 'eq', book.id))} == {1, 2}
+
+
 def test_script_new(db):
     """test Script.new"""
-    ctxt = for_levels(partial(
+    ctxt = at_level(partial(
         core.Script.new,
         name='test-script',
         code='this should be valid Lua code',
         setlevel=3,
         permissions=core.ScriptPermissions(3)),
-        4,
+        'Script.new',
     )
     script_new = partial(core.Script.new, login_context=ctxt)
     script = models.Script.get_by_id('test-script')
@@ -767,11 +891,11 @@ def test_script_edit(db):
     # noinspection PyArgumentList
     models.Script.create(name='name', code='code', setlevel=3,
                          permissions=core.ScriptPermissions(0), storage={})
-    ctxt = for_levels(partial(
+    ctxt = at_level(partial(
         core.Script.edit,
         'name',
         code='new code'),
-        4
+        'Script.edit'
     )
     script_edit = partial(core.Script.edit, login_context=ctxt)
     assert models.Script.get_by_id('name').code == 'new code'
@@ -793,11 +917,7 @@ def test_script_execute(db, monkeypatch):
 
     def lua_prep_rt(*args, **kwargs):
         calls.append(kwargs)
-        return type('', (), {
-            'execute': lambda c: {
-                'func': lambda: calls.append('func'),
-            }
-        })
+        return DummyRuntime(calls)
 
     monkeypatch.setattr('buchschloss.lua.prepare_runtime', lua_prep_rt)
     monkeypatch.setattr(core.Script, 'callbacks', 'cls-cb-flag')
@@ -839,15 +959,16 @@ def test_script_view_str(db):
     expected = {
         '__str__': exp_repr, 'name': 'name',
         'setlevel': '-----', 'permissions': ''}
-    ctxt = for_levels(partial(core.Script.view_str, 'name'), 0, lambda x: x == expected)
+    ctxt = for_levels(partial(core.Script.view_str, 'name'), 'Script.view_str',
+                      lambda x: x == expected)
     script_view_str = partial(core.Script.view_str, login_context=ctxt)
     script.setlevel = 0
     script.permissions = core.ScriptPermissions.STORE | core.ScriptPermissions.REQUESTS
     script.save()
     data = script_view_str('name')
-    assert set(data.pop('permissions').split(';')) == {
+    assert semisplit(data.pop('permissions')) == sorted([
         utils.get_name('Script::permissions::STORE'),
-        utils.get_name('Script::permissions::REQUESTS')}
+        utils.get_name('Script::permissions::REQUESTS')])
     l0 = utils.level_names[0]
     assert data == {'name': 'name', 'setlevel': l0, '__str__': exp_repr + l0.join('()')}
     script.setlevel = 3
@@ -1,5 +1,4 @@
 """Test the lua stdlib"""
-import collections
 import datetime
 import types
 
@@ -9,15 +8,20 @@ from buchschloss import lua
 
 class DummyActionNS:
     """Save all calls and return fabricated results"""
+    actions = ('new', 'view_ns', 'edit', 'search', 'restitute', 'activate')
 
     def __init__(self, results):
         self.results = {k: iter(v) for k, v in results.items()}
-        self.calls = collections.defaultdict(list)
+        self.calls = {name: [] for name in self.actions}
+        vars(self).update((name, self._make_action(name)) for name in self.actions)
+
+    def _make_action(self, name):
+        """return a function saving its calls under ``name``"""
+        results = self.results.get(name, iter(()))
 
-    def __getattr__(self, item):
         def func(*args, **kwargs):
-            self.calls[item].append((args, kwargs))
-            return next(self.results.get(item, iter(())), None)
+            self.calls[name].append((args, kwargs))
+            return next(results, None)
         return func
 
 
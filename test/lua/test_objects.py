@@ -9,6 +9,8 @@ from buchschloss import lua
 from buchschloss import utils
 from buchschloss.lua import objects
 
+_MISSING = object()
+
 
 class Dummy:  # TODO: move this out to misc
     """Provide a dummy object
@@ -18,47 +20,58 @@ class Dummy:  # TODO: move this out to misc
         _str: the string representation of self
         _call: a callable to call (default: return self)
         _bool: value to return when __bool__ is called
-        _items: mapping or sequence to delegate __getitem__ to. _default will be returned on Key, Index or AttributeError
+        _items: mapping or sequence to delegate __getitem__ to. _default will be returned if unset or on Key or IndexError
     """
-    def __init__(self, _bool=True, _call=lambda s, *a, **kw: s, **kwargs):
+    def __init__(self, _bool=True, _call=None, **kwargs):
         """Set the attributes given in kwargs."""
         self._bool = _bool
         self._call = _call
+        self._default = self
+        self._str = self._items = self._instance = _MISSING
         for k, v in kwargs.items():
             setattr(self, k, v)
 
     def __str__(self):
         """return self._str if set, else '-----'"""
-        try:
-            return self._str
-        except AttributeError:
-            return '-----'
+        return '-----' if self._str is _MISSING else self._str
 
     def __call__(self, *args, **kwargs):
+        if self._call is None:
+            return self
         return self._call(self, *args, **kwargs)
 
     def __bool__(self):
         return self._bool
 
     def __getattr__(self, item):
-        """return self._default if set, else self"""
-        if item == '_default':
-            return self
-        elif item in ('_str', '_items', '_instance'):  # _bool and _call are always set
-            raise AttributeError
-        else:
-            return self._default
+        """return self._default for attributes that aren't set"""
+        return self._default
 
     def __getitem__(self, item):
+        if self._items is _MISSING:
+            return self._default
         try:
             return self._items[item]
-        except (KeyError, IndexError, AttributeError):
+        except (KeyError, IndexError):
             return self._default
 
     def __instancecheck__(self, instance):
         return self._instance(instance, self)
 
 
+class Spy:
+    """save the argument of each call and return a fixed value"""
+    __slots__ = ('calls', 'return_val')
+
+    def __init__(self, return_val=None):
+        self.calls = []
+        self.return_val = return_val
+
+    def __call__(self, arg):
+        self.calls.append(arg)
+        return self.return_val
+
+
 def test_action_ns():
     FLAG = object()
 
@@ -134,18 +147,11 @@ def test_login_context():
 
 
 def test_ui_interaction(monkeypatch):
-    def save_arg(return_val=None):
-        """return a function that saves its argument when called"""
-        def func(arg):
-            func.calls.append(arg)
-            return return_val
-        func.calls = []
-        return func
-    display = save_arg()
-    get_data = save_arg()
-    ask = save_arg()
-    alert = save_arg()
-    get_name = save_arg('get_name_flag')
+    display = Spy()
+    get_data = Spy()
+    ask = Spy()
+    alert = Spy()
+    get_name = Spy('get_name_flag')
     monkeypatch.setattr(utils, 'get_name', get_name)
     rt = lupa.LuaRuntime()
     default_cb = {'display': display, 'get_data': get_data}
@@ -193,6 +199,7 @@ def test_requests_bs4(monkeypatch):
     assert rt.eval('r.text') == 'HTMLHTML'
     assert rt.eval('r.select_one("body").text') == 'HTML'
     assert rt.eval("r.select_one('#content').attrs.id") == 'content'
+    assert rt.eval('r.attrs == r.attrs')
     assert rt.eval('r.select_one("p").text == r.select("p")[1].text')
     assert (rt.eval('requests.get("https://test.invalid/plain.txt", "html").text')
             == 'This is plain text')
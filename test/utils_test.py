@@ -1,6 +1,5 @@
 """test utils"""
 import datetime
-import time
 
 from buchschloss import config
 
@@ -9,9 +8,9 @@ config.core.mapping['database name'] = ':memory:'
 from buchschloss import core, models, utils, py_scripts  # noqa
 
 
-def test_get_name():
+def test_get_name(monkeypatch):
     """Test get_name"""
-    config.utils.names = {
+    monkeypatch.setattr(config.utils, 'names', {
         'a': {
             'b': {
                 'c': {
@@ -34,7 +33,7 @@ def test_get_name():
         },
         'f': 'F',
         'g': 'G',
-    }
+    })
     assert utils.get_name('a::b::c::d') == 'ABCD'
     assert utils.get_name('a::b::c') == 'ABC'
     assert utils.get_name('a::b::c::e') == 'ABCE'
@@ -46,6 +45,8 @@ def test_get_name():
     assert utils.get_name('a::b::c__e') == 'ABC: ABCE'
     assert utils.get_name('a::c::h__i') == 'ACH: CI'
     assert utils.get_name('c::d::does::not::exist') == 'c::d::does::not::exist'
+    monkeypatch.setattr(config.utils, 'names', {'f': 'other F'})
+    assert utils.get_name('a::b::c::f') == 'other F'
 
 
 def test_script_exec(db, monkeypatch):
@@ -75,12 +76,13 @@ def test_script_exec(db, monkeypatch):
     callbacks = {'alert': invokes.add, 'display': lambda x: None}
     monkeypatch.setattr(core.Script, 'callbacks', callbacks)
 
-    runner = utils.get_runner()
+    now = [datetime.datetime.now().timestamp()]
+    runner = utils.get_runner(timefunc=lambda: now[0])
     runner(False)
     runner(False)
     assert invokes == {'test_2', 'test_3', 'script-data::test-5::yep'}
     invokes.clear()
-    time.sleep(0.15)
+    now[0] += 0.15
     runner(False)
     assert invokes == {'test_3'}
     invokes.clear()